@@ -2,20 +2,51 @@ from __future__ import annotations
 
 from typing import Optional, Dict, Any, List, Tuple
 import re
+import atexit
+import functools
 import httpx
-import csv
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache, cached
+import orjson
 import uuid
 import io
+import os
+from array import array
+from dataclasses import asdict, dataclass
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 from rapidfuzz import fuzz, process
 from google.adk.agents import Agent
 
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from ag_ui_adk import ADKAgent, add_adk_fastapi_endpoint
 from google.adk import tools as adk_tools
 
 NPI_API = "https://npiregistry.cms.hhs.gov/api/"
 CMS_HOSPITAL_DATA_URL = "https://data.cms.gov/provider-data/sites/default/files/resources/893c372430d9d71a1c52737d01239d47_1753409109/Hospital_General_Information.csv"
 
+# One shared client so repeated NPPES/CMS calls reuse pooled connections
+# instead of paying DNS + TCP + TLS setup per request.
+_HTTP = httpx.Client(
+    timeout=30,
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+    headers={"Accept-Encoding": "gzip"},
+)
+atexit.register(_HTTP.close)
+
+# Small pool for issuing independent NPPES lookups in parallel; the tools are
+# sync-called from ADK and the requests are I/O-bound, so threads overlap the
+# socket waits.
+_NPPES_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="nppes")
+atexit.register(_NPPES_POOL.shutdown)
+
+def _valid_npi(s: str) -> bool:
+    """Ten ASCII digits; two C-level string calls instead of a regex walk."""
+    return len(s) == 10 and s.isascii() and s.isdigit()
+
 _LABELS = [
     "general acute care hospital",
     "critical access hospital",
@@ -57,31 +88,48 @@ _TAXONOMY_CODE_MAP: Dict[str, str] = {
 # -------------------------------
 # Fallback keyword mapping when codes are missing/unknown (order matters)
 # -------------------------------
-_TAXONOMY_KEYWORD_MAP: List[Tuple[re.Pattern, str]] = [
+_TAXONOMY_KEYWORD_MAP: List[Tuple[str, str]] = [
     # Oncology first so we don't miss it
-    (re.compile(r"\bradiation\s+oncology\b", re.I), "radiation oncology clinic/center"),
-    (re.compile(r"\boncology\b", re.I), "oncology clinic/center"),
+    (r"\bradiation\s+oncology\b", "radiation oncology clinic/center"),
+    (r"\boncology\b", "oncology clinic/center"),
 
     # SNF/LTC
-    (re.compile(r"\bskilled\s+nursing\b", re.I), "skilled nursing facility"),
-    (re.compile(r"\bnursing\s+facility\b", re.I), "ltc facility"),
-    (re.compile(r"\bassisted\s+living\b", re.I), "ltc facility"),
-    (re.compile(r"\bcustodial\s+care\b", re.I), "ltc facility"),
+    (r"\bskilled\s+nursing\b", "skilled nursing facility"),
+    (r"\bnursing\s+facility\b", "ltc facility"),
+    (r"\bassisted\s+living\b", "ltc facility"),
+    (r"\bcustodial\s+care\b", "ltc facility"),
 
     # LTAC
-    (re.compile(r"\blong[-\s]?term\s+care\s+hospital\b", re.I), "ltac hospital"),
-    (re.compile(r"\blong[-\s]?term\s+acute\s+care\b", re.I), "ltac hospital"),
+    (r"\blong[-\s]?term\s+care\s+hospital\b", "ltac hospital"),
+    (r"\blong[-\s]?term\s+acute\s+care\b", "ltac hospital"),
 
     # Other hospitals
-    (re.compile(r"\bgeneral\s+acute\s+care\b", re.I), "general acute care hospital"),
-    (re.compile(r"\bcritical\s+access\b", re.I), "critical access hospital"),
-    (re.compile(r"\bpsychiatric\b", re.I), "psychiatric hospital"),
-    (re.compile(r"\brehabilitation\b", re.I), "rehabilitation hospital"),
+    (r"\bgeneral\s+acute\s+care\b", "general acute care hospital"),
+    (r"\bcritical\s+access\b", "critical access hospital"),
+    (r"\bpsychiatric\b", "psychiatric hospital"),
+    (r"\brehabilitation\b", "rehabilitation hospital"),
 ]
 
+# Single alternation so one pass of the regex engine finds every keyword hit
+# instead of running each pattern over the same string; the named groups
+# record which keyword fired. Note a bare search() would return the leftmost
+# hit in the haystack, not the highest-priority one, so _classify_taxonomy
+# scans all hits and takes the smallest group index (radiation oncology
+# before oncology, etc).
+# Compiled case-sensitive: the haystack is lowercased once per entry, which is
+# cheaper than per-character case folding inside the regex engine.
+_KEYWORD_RE = re.compile(
+    "|".join(f"(?P<g{i}>{pat})" for i, (pat, _label) in enumerate(_TAXONOMY_KEYWORD_MAP))
+)
+_KEYWORD_LABELS = [label for _pat, label in _TAXONOMY_KEYWORD_MAP]
+
 # -------------------------------
 # Low-level helpers
 # -------------------------------
+# NPPES records are stable over short horizons, so cache lookups for an hour.
+# get_facility_profile_by_npi hits the same NPI twice (facility type + related
+# NPIs); with the cache that's one network call instead of two.
+@cached(TTLCache(maxsize=4096, ttl=3600), lock=threading.Lock())
 def _nppes_by_name(hospital_name: str, state: Optional[str] = None) -> Dict[str, Any]:
     params = {
         "version": "2.1",
@@ -91,85 +139,255 @@ def _nppes_by_name(hospital_name: str, state: Optional[str] = None) -> Dict[str,
     }
     if state:
         params["state"] = state
-    with httpx.Client(timeout=30) as client:
-        r = client.get(NPI_API, params=params)
-        r.raise_for_status()
-        return r.json()
+    r = _HTTP.get(NPI_API, params=params)
+    r.raise_for_status()
+    # orjson parses the raw bytes directly, skipping the str decode r.json() does
+    return orjson.loads(r.content)
 
+@cached(TTLCache(maxsize=4096, ttl=3600), lock=threading.Lock())
 def _nppes_by_npi(npi: str) -> Dict[str, Any]:
-    with httpx.Client(timeout=30) as client:
-        r = client.get(NPI_API, params={"version": "2.1", "number": npi})
-        r.raise_for_status()
-        return r.json()
+    r = _HTTP.get(NPI_API, params={"version": "2.1", "number": npi})
+    r.raise_for_status()
+    return orjson.loads(r.content)
 
 # -------------------------------
 # CMS Hospital Data Helpers
 # -------------------------------
-_CMS_DATA_CACHE: List[Dict[str, Any]] = []
+# Only the columns the tools actually use downstream.
+_CMS_COLUMNS = (
+    "Facility ID",
+    "Facility Name",
+    "Address",
+    "City/Town",
+    "State",
+    "ZIP Code",
+    "Hospital Type",
+)
 
-def _fetch_cms_hospital_data() -> List[Dict[str, Any]]:
-    """Fetch CMS Hospital General Information CSV and return as list of dicts."""
+# On-disk cache so warm restarts skip the download and the CSV parse entirely.
+_CMS_PARQUET_PATH = "/tmp/cms_hosp.parquet"
+_CMS_ETAG_PATH = "/tmp/cms_hosp.etag"
+
+# Columnar cache: column name -> flat list of values, one entry per hospital.
+# Cheaper than one ~30-key dict per row and friendlier to the fuzzy scan.
+_CMS_DATA_CACHE: Dict[str, List[str]] = {}
+# Pre-normalized views built once at cache load so rapidfuzz never has to
+# re-preprocess tens of thousands of candidate strings per query.
+_CMS_NAMES_UPPER: List[str] = []
+# state -> (row indices into the column lists, matching uppercased names);
+# indices are stored as array('i') rather than lists of boxed ints.
+_CMS_BY_STATE: Dict[str, Tuple[array, List[str]]] = {}
+# (uppercased name, state or None) -> row indices, for exact-match lookups
+_CMS_EXACT: Dict[Tuple[str, Optional[str]], List[int]] = {}
+# Shared miss value for unknown states, so lookups never allocate.
+_EMPTY_BUCKET: Tuple[array, List[str]] = (array("i"), [])
+
+# One-shot guard so concurrent first requests don't race to download and parse
+# the CSV; the event gives readers a lock-free fast path once loaded.
+_CMS_LOCK = threading.Lock()
+_CMS_READY = threading.Event()
+
+def _build_cms_indexes(cols: Dict[str, List[str]]) -> None:
+    """Populate the pre-normalized name list, per-state buckets, and exact index."""
+    global _CMS_NAMES_UPPER, _CMS_BY_STATE, _CMS_EXACT
+    names_upper: List[str] = []
+    by_state: Dict[str, Tuple[List[int], List[str]]] = {}
+    exact: Dict[Tuple[str, Optional[str]], List[int]] = {}
+    states = cols["State"]
+    for i, name in enumerate(cols["Facility Name"]):
+        name_upper = (name or "").upper()
+        names_upper.append(name_upper)
+        st = states[i] or ""
+        bucket = by_state.get(st)
+        if bucket is None:
+            bucket = by_state[st] = ([], [])
+        bucket[0].append(i)
+        bucket[1].append(name_upper)
+        exact.setdefault((name_upper, None), []).append(i)
+        if st:
+            exact.setdefault((name_upper, st), []).append(i)
+    _CMS_NAMES_UPPER = names_upper
+    _CMS_BY_STATE = {
+        st: (array("i", idxs), names) for st, (idxs, names) in by_state.items()
+    }
+    _CMS_EXACT = exact
+
+def _columns_from_table(table: pa.Table) -> Dict[str, List[str]]:
+    return {name: table.column(name).to_pylist() for name in _CMS_COLUMNS}
+
+class _ResponseStream(io.RawIOBase):
+    """Minimal read-only file object over an httpx streaming response, so
+    pyarrow can parse the CSV incrementally without the whole body in RAM."""
+
+    def __init__(self, iter_bytes):
+        self._iter = iter_bytes
+        self._buf = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buf:
+            try:
+                self._buf = next(self._iter)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+def _try_load_cms_from_disk() -> Optional[Dict[str, List[str]]]:
+    """Reuse the on-disk parquet cache when the CMS file's ETag is unchanged."""
+    try:
+        if not (os.path.exists(_CMS_PARQUET_PATH) and os.path.exists(_CMS_ETAG_PATH)):
+            return None
+        with open(_CMS_ETAG_PATH, encoding="utf-8") as f:
+            cached_etag = f.read().strip()
+        if not cached_etag:
+            return None
+        head = _HTTP.head(CMS_HOSPITAL_DATA_URL, follow_redirects=True)
+        if head.headers.get("ETag", "").strip() != cached_etag:
+            return None
+        return _columns_from_table(pq.read_table(_CMS_PARQUET_PATH))
+    except Exception:
+        # Disk cache is best-effort; fall back to a full fetch.
+        return None
+
+def _save_cms_to_disk(table: pa.Table, etag: Optional[str]) -> None:
+    """Persist the parsed table so the next cold start can skip download+parse."""
+    if not etag:
+        return
+    try:
+        pq.write_table(table, _CMS_PARQUET_PATH)
+        with open(_CMS_ETAG_PATH, "w", encoding="utf-8") as f:
+            f.write(etag.strip())
+    except Exception:
+        pass
+
+def _fetch_cms_hospital_data() -> Dict[str, List[str]]:
+    """Fetch the CMS Hospital General Information CSV into columnar lists."""
     global _CMS_DATA_CACHE
-    if _CMS_DATA_CACHE:
+    # Lock-free fast path once the cache has been built.
+    if _CMS_READY.is_set():
         return _CMS_DATA_CACHE
 
-    try:
-        with httpx.Client(timeout=60) as client:
-            r = client.get(CMS_HOSPITAL_DATA_URL, follow_redirects=True)
-            r.raise_for_status()
-
-            # Parse CSV
-            f = io.StringIO(r.text)
-            reader = csv.DictReader(f)
-            data = list(reader)
-
-            if data:
-                _CMS_DATA_CACHE = data
-            return data
-    except Exception as e:
-        print(f"Error fetching CMS data: {e}")
-        return []
+    with _CMS_LOCK:
+        # Another request may have finished the load while we waited.
+        if _CMS_READY.is_set():
+            return _CMS_DATA_CACHE
+
+        cols = _try_load_cms_from_disk()
+        if cols and cols["Facility Name"]:
+            _CMS_DATA_CACHE = cols
+            _build_cms_indexes(cols)
+            _CMS_READY.set()
+            return cols
+
+        try:
+            # Stream the response straight into pyarrow's incremental CSV reader;
+            # the body is never double-buffered as bytes + decoded text.
+            with _HTTP.stream("GET", CMS_HOSPITAL_DATA_URL, follow_redirects=True, timeout=60) as r:
+                r.raise_for_status()
+                reader = pacsv.open_csv(
+                    _ResponseStream(r.iter_bytes(65536)),
+                    convert_options=pacsv.ConvertOptions(
+                        include_columns=list(_CMS_COLUMNS),
+                        column_types={c: pa.string() for c in _CMS_COLUMNS},
+                    ),
+                )
+                table = reader.read_all()
+                etag = r.headers.get("ETag")
+            cols = _columns_from_table(table)
+
+            if cols["Facility Name"]:
+                _save_cms_to_disk(table, etag)
+                _CMS_DATA_CACHE = cols
+                _build_cms_indexes(cols)
+                _CMS_READY.set()
+            return cols
+        except Exception as e:
+            # Leave the event unset so a later request retries the load.
+            print(f"Error fetching CMS data: {e}")
+            return {}
+
+@dataclass(slots=True)
+class HospitalMatch:
+    """One CMS hospital hit; slots keep rows compact until the JSON boundary."""
+    ccn: Optional[str]
+    name: Optional[str]
+    address: Optional[str]
+    city: Optional[str]
+    state: Optional[str]
+    zip: Optional[str]
+    hospital_type: Optional[str]
+    match_score: float
+
+def _match_from_row(cols: Dict[str, List[str]], row: int, score: float) -> HospitalMatch:
+    return HospitalMatch(
+        ccn=cols["Facility ID"][row],
+        name=cols["Facility Name"][row],
+        address=cols["Address"][row],
+        city=cols["City/Town"][row],
+        state=cols["State"][row],
+        zip=cols["ZIP Code"][row],
+        hospital_type=cols["Hospital Type"][row],
+        match_score=score,
+    )
 
-def _search_hospital_by_name(hospital_name: str, state: Optional[str] = None, limit: int = 5) -> List[Dict[str, Any]]:
+def _search_hospital_by_name(hospital_name: str, state: Optional[str] = None, limit: int = 5) -> List[HospitalMatch]:
     """Search for hospitals by name using fuzzy matching."""
-    data = _fetch_cms_hospital_data()
-    if not data:
+    cols = _fetch_cms_hospital_data()
+    if not cols:
         return []
 
-    # Filter by state first if provided (optimization)
+    query_upper = hospital_name.upper().strip()
+
+    # Use the pre-bucketed per-state index when a state is given (optimization)
     if state:
         state = state.upper().strip()
-        data = [d for d in data if d.get("State") == state]
+        idx_list, names_upper = _CMS_BY_STATE.get(state, _EMPTY_BUCKET)
+    else:
+        state = None
+        idx_list, names_upper = None, _CMS_NAMES_UPPER
 
-    if not data:
+    if not names_upper:
         return []
 
-    names = [d.get("Facility Name", "") for d in data]
-
-    # rapidfuzz.process.extract returns list of (match, score, index)
+    # Exact name hit: O(1) dict lookup, no fuzzy scan at all.
+    exact_rows = _CMS_EXACT.get((query_upper, state))
+    if exact_rows:
+        return [_match_from_row(cols, row, 100.0) for row in exact_rows[:limit]]
+
+    # token_set_ratio is noisy on very short queries; use plain substring
+    # containment instead of fuzzy scoring.
+    if len(query_upper) <= 4:
+        matches = []
+        for pos, name_upper in enumerate(names_upper):
+            if query_upper in name_upper:
+                row = idx_list[pos] if idx_list is not None else pos
+                matches.append(_match_from_row(cols, row, 100.0))
+                if len(matches) >= limit:
+                    break
+        return matches
+
+    # rapidfuzz.process.extract returns list of (match, score, index);
+    # candidates are already uppercased, so skip rapidfuzz's own processor.
+    # score_cutoff lets rapidfuzz abort scoring candidates whose cheap upper
+    # bound already falls below the threshold, instead of filtering in Python.
     results = process.extract(
-        hospital_name.upper(),
-        names,
+        query_upper,
+        names_upper,
         limit=limit,
         scorer=fuzz.token_set_ratio,
+        processor=None,
+        score_cutoff=60,
     )
 
     matches = []
     for match_name, score, idx in results:
-        if score < 60:  # Minimum threshold
-            continue
-
-        record = data[idx]
-        matches.append({
-            "ccn": record.get("Facility ID"),
-            "name": record.get("Facility Name"),
-            "address": record.get("Address"),
-            "city": record.get("City/Town"),
-            "state": record.get("State"),
-            "zip": record.get("ZIP Code"),
-            "hospital_type": record.get("Hospital Type"),
-            "match_score": score,
-        })
+        row = idx_list[idx] if idx_list is not None else idx
+        matches.append(_match_from_row(cols, row, score))
 
     return matches
 
@@ -182,13 +400,24 @@ def _classify_taxonomy(entry: Dict[str, Any]) -> List[str]:
     facility kinds such as 'ltac hospital', 'ltc facility', 'skilled nursing facility',
     or 'oncology clinic/center'. Falls back to 'unknown' when nothing matches.
     """
+    key = tuple(
+        (t.get("code") or "", t.get("desc") or t.get("taxonomy_group") or "")
+        for t in (entry.get("taxonomies") or [])
+    )
+    return list(_classify_taxonomy_cached(key))
+
+# The same org shows up repeatedly (profile calls re-fetch the query NPI, and
+# related-NPI expansion classifies every candidate), so memoize on the
+# hashable (code, desc) pairs rather than re-running the regex work.
+@functools.lru_cache(maxsize=4096)
+def _classify_taxonomy_cached(taxonomies: Tuple[Tuple[str, str], ...]) -> Tuple[str, ...]:
     kinds: List[str] = []
     has_hospital = False
     has_onc = False
 
-    for t in (entry.get("taxonomies") or []):
-        code = (t.get("code") or "").upper()
-        desc = (t.get("desc") or t.get("taxonomy_group") or "").strip()
+    for raw_code, raw_desc in taxonomies:
+        code = raw_code.upper()
+        desc = raw_desc.strip()
 
         # 1) Exact code map wins
         mapped = _TAXONOMY_CODE_MAP.get(code)
@@ -201,34 +430,47 @@ def _classify_taxonomy(entry: Dict[str, Any]) -> List[str]:
                 has_hospital = True
             continue
 
-        # 2) Keyword fallback on description/code text
-        hay = f"{code} {desc}".strip()
-        for rx, label in _TAXONOMY_KEYWORD_MAP:
-            if rx.search(hay):
-                if label not in kinds:
-                    kinds.append(label)
-                if "oncology" in label:
-                    has_onc = True
-                if "hospital" in label:
-                    has_hospital = True
-                break
+        # 2) Keyword fallback on description/code text (lowered once so the
+        # case-sensitive alternation can use the engine's literal fast paths).
+        # Collect every hit and keep the smallest group index, so map priority
+        # decides rather than position in the haystack.
+        hay = f"{code} {desc}".strip().lower()
+        best = min(
+            (int(m.lastgroup[1:]) for m in _KEYWORD_RE.finditer(hay)),
+            default=-1,
+        )
+        if best != -1:
+            label = _KEYWORD_LABELS[best]
+            if label not in kinds:
+                kinds.append(label)
+            if "oncology" in label:
+                has_onc = True
+            if "hospital" in label:
+                has_hospital = True
 
     # If it looks like a hospital entity that also has oncology signals,
     # ensure we surface the oncology clinic tag (readable heuristic).
     if has_hospital and has_onc and "oncology clinic/center" not in kinds:
         kinds.append("oncology clinic/center")
 
-    return kinds or ["unknown"]
+    return tuple(kinds) if kinds else ("unknown",)
+
+def _city_eq(a: str, b: str) -> bool:
+    """Cities almost always match exactly or not at all; skip the fuzzy DP."""
+    return (a or "").strip().upper() == (b or "").strip().upper()
 
 def _pick_best_result_by_name(query_name: str, results: List[Dict[str, Any]]) -> Tuple[int, Dict[str, Any]]:
     """Pick the best NPPES org result by fuzzy name similarity."""
     if not results:
         raise ValueError("No results to choose from.")
-    names = [(r.get("basic") or {}).get("legal_business_name", "") for r in results]
-    if not names or all(not n for n in names):
+    names = [((r.get("basic") or {}).get("legal_business_name") or "").upper() for r in results]
+    if not any(names):
         return 0, results[0]
-    # RapidFuzz extractOne returns (match, score, index)
-    _match, _score, best_idx = process.extractOne(query_name, names)
+    # RapidFuzz extractOne returns (match, score, index); names are already
+    # uppercased, so skip the per-string processor.
+    _match, _score, best_idx = process.extractOne(
+        query_name.upper(), names, scorer=fuzz.WRatio, processor=None
+    )
     if best_idx is None:
         best_idx = 0
     return best_idx, results[best_idx]
@@ -243,7 +485,7 @@ def get_facility_type_by_npi(npi: str) -> dict:
       { status, report, data?: { name, npi, kinds[], city, state } }
     """
     npi_clean = (npi or "").strip()
-    if not re.fullmatch(r"\d{10}", npi_clean):
+    if not _valid_npi(npi_clean):
         return {"status": "error", "error_message": "Provide a valid 10-digit NPI."}
 
     try:
@@ -284,7 +526,7 @@ def get_related_npis(npi: str) -> dict:
       { status, report, data?: { query_npi, related_npis: [{npi,name,kinds[],city,is_subpart}] } }
     """
     npi_clean = (npi or "").strip()
-    if not re.fullmatch(r"\d{10}", npi_clean):
+    if not _valid_npi(npi_clean):
         return {"status": "error", "error_message": "Provide a valid 10-digit NPI."}
 
     try:
@@ -302,12 +544,17 @@ def get_related_npis(npi: str) -> dict:
     parent_lbn = basic.get("parent_organization_legal_business_name")
     target_city = ((org.get("addresses") or [{}])[0] or {}).get("city", "")
 
-    # Expand by LBN and parent LBN
+    # Expand by LBN and parent LBN; the two lookups are independent, so run
+    # them concurrently instead of serializing the round-trips. A plain
+    # filtered tuple avoids the two ephemeral sets of {a,b} - {None, ""}.
+    if parent_lbn == lbn:
+        parent_lbn = None
+    queries = tuple(q for q in (lbn, parent_lbn) if q)
     candidates: List[Dict[str, Any]] = []
-    for q in {lbn, parent_lbn} - {None, ""}:
+    futures = [_NPPES_POOL.submit(_nppes_by_name, q) for q in queries]
+    for fut in futures:
         try:
-            qdata = _nppes_by_name(q)
-            candidates.extend(qdata.get("results") or [])
+            candidates.extend(fut.result().get("results") or [])
         except Exception:
             pass
 
@@ -319,14 +566,25 @@ def get_related_npis(npi: str) -> dict:
             seen.add(n)
             dedup.append(r)
 
-    # Fuzzy tighten (name + city) to keep close siblings/locations
+    # Fuzzy tighten (name + city) to keep close siblings/locations.
+    # Score all candidate names in one rapidfuzz call instead of one
+    # Python->C++ transition per candidate; names below 70 can never survive
+    # the city penalty, so the cutoff prunes them inside rapidfuzz.
     keep: List[Dict[str, Any]] = []
-    for r in dedup:
-        name_r = (r.get("basic") or {}).get("legal_business_name", "")
-        score = fuzz.token_set_ratio(name_r, lbn or "")
+    cand_names = [(r.get("basic") or {}).get("legal_business_name", "") or "" for r in dedup]
+    scored = process.extract(
+        lbn or "",
+        cand_names,
+        scorer=fuzz.token_set_ratio,
+        processor=None,
+        score_cutoff=70,
+        limit=None,
+    )
+    for _name, score, idx in scored:
+        r = dedup[idx]
         city_r = ((r.get("addresses") or [{}])[0] or {}).get("city", "")
-        if target_city:
-            score = (score + fuzz.partial_ratio(city_r or "", target_city or "")) / 2
+        if target_city and not _city_eq(city_r, target_city):
+            score -= 20
         if score >= 70:
             keep.append(r)
 
@@ -378,10 +636,11 @@ def get_ccn_by_hospital_name(hospital_name: str, state: Optional[str] = None) ->
 
     top = matches[0]
     summary = (
-        f"Found {len(matches)} matches. Top match: {top['name']} "
-        f"(CCN: {top['ccn']}) in {top['city']}, {top['state']}."
+        f"Found {len(matches)} matches. Top match: {top.name} "
+        f"(CCN: {top.ccn}) in {top.city}, {top.state}."
     )
-    return {"status": "success", "report": summary, "data": {"matches": matches}}
+    # Dicts only at the tool boundary, where the response is serialized.
+    return {"status": "success", "report": summary, "data": {"matches": [asdict(m) for m in matches]}}
 
 def get_facility_profile_by_npi(npi: str) -> dict:
     """
@@ -400,7 +659,7 @@ def get_facility_profile_by_npi(npi: str) -> dict:
       }
     """
     npi_clean = (npi or "").strip()
-    if not re.fullmatch(r"\d{10}", npi_clean):
+    if not _valid_npi(npi_clean):
         return {"status": "error", "error_message": "Provide a valid 10-digit NPI."}
 
     info = get_facility_type_by_npi(npi_clean)
@@ -450,7 +709,7 @@ root_agent = Agent(
     tools=[get_facility_profile_by_npi, get_facility_type_by_npi, get_related_npis, get_ccn_by_hospital_name],
 )
 
-app = FastAPI(title="HLH Agent")
+app = FastAPI(title="HLH Agent", default_response_class=ORJSONResponse)
 
 HLHAgent = ADKAgent(
     adk_agent=root_agent,
@@ -462,3 +721,9 @@ HLHAgent = ADKAgent(
 
 add_adk_fastapi_endpoint(app, HLHAgent, path="/")
 
+@app.on_event("startup")
+def _warm_cms_cache() -> None:
+    # Kick off the CMS load in the background so the first CCN lookup never
+    # pays the cold download+parse latency; the lock keeps it single-flight.
+    threading.Thread(target=_fetch_cms_hospital_data, daemon=True).start()
+